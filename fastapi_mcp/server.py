@@ -84,6 +84,16 @@ class FastApiMCP:
                 """
             ),
         ] = ["authorization"],
+        openapi_schema: Annotated[
+            Optional[Dict[str, Any]],
+            Doc(
+                """
+                Optional OpenAPI schema to create the MCP tools from, instead of generating it from the app's routes.
+                Useful for exposing another service's API, together with an `http_client` pointed at that service.
+                When set, `setup_server()` keeps using this schema and does not pick up routes added to the app.
+                """
+            ),
+        ] = None,
     ):
         # Validate operation and tag filtering options
         if include_operations is not None and exclude_operations is not None:
@@ -108,6 +118,7 @@ class FastApiMCP:
         self._include_tags = include_tags
         self._exclude_tags = exclude_tags
         self._auth_config = auth_config
+        self._openapi_schema = openapi_schema
 
         if self._auth_config:
             self._auth_config = self._auth_config.model_validate(self._auth_config)
@@ -124,13 +135,16 @@ class FastApiMCP:
         self.setup_server()
 
     def setup_server(self) -> None:
-        openapi_schema = get_openapi(
-            title=self.fastapi.title,
-            version=self.fastapi.version,
-            openapi_version=self.fastapi.openapi_version,
-            description=self.fastapi.description,
-            routes=self.fastapi.routes,
-        )
+        if self._openapi_schema is not None:
+            openapi_schema = self._openapi_schema
+        else:
+            openapi_schema = get_openapi(
+                title=self.fastapi.title,
+                version=self.fastapi.version,
+                openapi_version=self.fastapi.openapi_version,
+                description=self.fastapi.description,
+                routes=self.fastapi.routes,
+            )
 
         all_tools, self.operation_map = convert_openapi_to_mcp_tools(
             openapi_schema,
@@ -11,122 +11,34 @@
 注意：这个方案需要能够访问原服务的 OpenAPI schema
 """
 
-import httpx
-import json
-import asyncio
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI
 from fastapi_mcp import FastApiMCP
-from typing import Dict, Any
+from starlette.middleware.gzip import GZipMiddleware
+
+from mcp_server_common import (
+    UVICORN_HTTP,
+    UVICORN_LOOP,
+    create_http_client,
+    create_lifespan,
+    ensure_operation_ids,
+    fetch_openapi_schema,
+    parse_cli_args,
+)
 
 # 原始 FastAPI 服务的地址
 ORIGINAL_API_URL = "http://localhost:6673"
 MCP_SERVER_PORT = 8000
 
-async def fetch_openapi_schema() -> Dict[str, Any]:
-    """从原始服务获取 OpenAPI schema"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(f"{ORIGINAL_API_URL}/openapi.json")
-            response.raise_for_status()
-            return response.json()
-        except httpx.RequestError as e:
-            raise Exception(f"无法连接到原始服务 {ORIGINAL_API_URL}: {e}")
-        except httpx.HTTPStatusError as e:
-            raise Exception(f"获取 OpenAPI schema 失败: {e.response.status_code}")
+# uvicorn 工作进程数。MCP 的 HTTP 会话保存在进程内存中，多个工作进程之间不共享会话，
+# 只有在客户端不依赖会话或前面有会话粘滞的负载均衡时才调大（例如 os.cpu_count()）
+MCP_SERVER_WORKERS = 1
 
-def create_proxy_routes(app: FastAPI, openapi_schema: Dict[str, Any]):
-    """根据 OpenAPI schema 创建代理路由"""
-    paths = openapi_schema.get("paths", {})
-    
-    async def create_proxy_handler(method: str, path_template: str):
-        """创建代理处理函数"""
-        async def handler(request: Request):
-            # 获取请求体
-            body = None
-            if request.method in ["POST", "PUT", "PATCH"]:
-                try:
-                    body = await request.json()
-                except:
-                    try:
-                        body = await request.body()
-                    except:
-                        pass
-            
-            # 获取查询参数
-            query_params = dict(request.query_params)
-            
-            # 获取请求头（转发授权等）
-            headers = {}
-            if "authorization" in request.headers:
-                headers["authorization"] = request.headers["authorization"]
-            
-            # 构建目标 URL，替换路径参数
-            target_path = path_template
-            path_params = request.path_params
-            for param_name, param_value in path_params.items():
-                target_path = target_path.replace(f"{{{param_name}}}", str(param_value))
-            
-            target_url = f"{ORIGINAL_API_URL}{target_path}"
-            
-            # 发送请求到原始服务
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                try:
-                    response = await client.request(
-                        method=method,
-                        url=target_url,
-                        params=query_params,
-                        headers=headers,
-                        json=body if body and isinstance(body, dict) else None,
-                        content=body if body and not isinstance(body, dict) else None,
-                    )
-                    
-                    # 处理响应
-                    if response.headers.get("content-type", "").startswith("application/json"):
-                        try:
-                            content = response.json()
-                        except:
-                            content = {"content": response.text}
-                    else:
-                        content = {"content": response.text}
-                    
-                    return JSONResponse(
-                        content=content,
-                        status_code=response.status_code,
-                        headers=dict(response.headers),
-                    )
-                except httpx.RequestError as e:
-                    raise HTTPException(status_code=502, detail=f"无法连接到原始服务: {e}")
-        
-        return handler
-    
-    # 为每个路径和方法创建路由
-    for path, path_item in paths.items():
-        for method in ["get", "post", "put", "delete", "patch"]:
-            if method in path_item:
-                operation = path_item[method]
-                operation_id = operation.get("operationId")
-                if not operation_id:
-                    # 如果没有 operation_id，生成一个
-                    operation_id = f"{method}_{path.replace('/', '_').replace('{', '').replace('}', '').strip('_')}"
-                
-                # 创建处理函数
-                handler = create_proxy_handler(method.upper(), path)
-                
-                # 注册路由
-                if method == "get":
-                    app.get(path, operation_id=operation_id, include_in_schema=True)(handler)
-                elif method == "post":
-                    app.post(path, operation_id=operation_id, include_in_schema=True)(handler)
-                elif method == "put":
-                    app.put(path, operation_id=operation_id, include_in_schema=True)(handler)
-                elif method == "delete":
-                    app.delete(path, operation_id=operation_id, include_in_schema=True)(handler)
-                elif method == "patch":
-                    app.patch(path, operation_id=operation_id, include_in_schema=True)(handler)
+# 连接 FastAPI 服务的 HTTP 传输层："httpx"（安装 h2 后启用 HTTP/2 多路复用）或
+# "aiohttp"（需要 pip install httpx-aiohttp，高并发时吞吐更高，但只支持 HTTP/1.1）
+MCP_HTTP_TRANSPORT = "httpx"
 
-async def setup_mcp_proxy():
-    """设置 MCP 代理服务器"""
+async def setup_mcp_proxy(app: FastAPI) -> bool:
+    """在服务的事件循环中设置 MCP 代理服务器：获取 schema 并据此挂载 MCP 服务器，工具调用直接发往原始服务"""
     print("=" * 60)
     print("MCP 代理服务器设置")
     print("=" * 60)
@@ -137,44 +49,38 @@ async def setup_mcp_proxy():
     # 获取 OpenAPI schema
     print("正在获取 OpenAPI schema...")
     try:
-        openapi_schema = await fetch_openapi_schema()
+        openapi_schema = await fetch_openapi_schema(ORIGINAL_API_URL)
         print(f"✓ 成功获取 OpenAPI schema")
         print(f"  - 服务名称: {openapi_schema.get('info', {}).get('title', 'Unknown')}")
         print(f"  - 版本: {openapi_schema.get('info', {}).get('version', 'Unknown')}")
         print(f"  - 路径数量: {len(openapi_schema.get('paths', {}))}")
-    except Exception as e:
+    except RuntimeError as e:
         print(f"❌ 错误: {e}")
         print("\n请确保：")
         print(f"  1. FastAPI 服务运行在 {ORIGINAL_API_URL}")
         print(f"  2. 服务可以访问 /openapi.json 端点")
-        return None
-    
-    # 创建代理 FastAPI 应用
-    print("\n正在创建代理应用...")
-    proxy_app = FastAPI(
-        title=f"MCP Proxy for {openapi_schema.get('info', {}).get('title', 'API')}",
-        description=f"MCP 代理服务器，连接到 {ORIGINAL_API_URL}",
-        version="1.0.0",
-    )
+        return False
     
-    # 创建代理路由
-    print("正在创建代理路由...")
-    create_proxy_routes(proxy_app, openapi_schema)
-    print("✓ 代理路由创建完成")
+    # 配置代理 FastAPI 应用：不注册任何路由，工具直接由原始服务的 schema 生成
+    print("\n正在配置代理应用...")
+    app.title = f"MCP Proxy for {openapi_schema.get('info', {}).get('title', 'API')}"
+    operation_count = ensure_operation_ids(openapi_schema)
+    # 进程内只保留这一份 schema（与 fetch_openapi_schema 的缓存是同一个对象）：FastApiMCP 据此生成工具，
+    # /openapi.json 也直接返回它，不再重新生成
+    app.openapi = lambda: openapi_schema  # type: ignore[method-assign]
+    print(f"✓ 已从 schema 读取 {operation_count} 个接口")
+    # MCP 工具调用经由这个连接池直接发往原始服务，由 lifespan 负责关闭
+    http_client = create_http_client(ORIGINAL_API_URL, transport=MCP_HTTP_TRANSPORT)
+    app.state.client = http_client
     
     # 创建 MCP 服务器
     print("\n正在创建 MCP 服务器...")
     try:
-        # 使用自定义 HTTP 客户端连接到原始服务
-        http_client = httpx.AsyncClient(
-            base_url=ORIGINAL_API_URL,
-            timeout=30.0,
-        )
-        
         mcp = FastApiMCP(
-            proxy_app,
+            app,
             name=f"MCP Proxy for {openapi_schema.get('info', {}).get('title', 'API')}",
             http_client=http_client,
+            openapi_schema=openapi_schema,
         )
         
         mcp.mount_http()
@@ -184,26 +90,46 @@ async def setup_mcp_proxy():
         print(f"\n在 Cursor 中配置：")
         print(f'   "url": "http://localhost:{MCP_SERVER_PORT}/mcp"')
         
-        return proxy_app
+        return True
         
     except Exception as e:
         print(f"❌ 创建 MCP 服务器失败: {e}")
-        return None
+        return False
+
+# 启动时完成 MCP 代理服务器设置，关闭时释放 MCP 服务器使用的 HTTP 客户端
+lifespan = create_lifespan(setup_mcp_proxy, "无法启动 MCP 代理服务器")
+
+# 不含业务路由的 FastAPI 应用：schema 获取和 MCP 挂载都在 lifespan 中完成
+proxy_app = FastAPI(
+    title="MCP Proxy",
+    description=f"MCP 代理服务器，连接到 {ORIGINAL_API_URL}",
+    version="1.0.0",
+    lifespan=lifespan,
+)
+# 压缩 1KB 以上的响应（大型 JSON 工具结果、/openapi.json）；已带 Content-Encoding 的响应
+# 和 text/event-stream 流不会被重复压缩
+proxy_app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 def main():
     """主函数"""
-    proxy_app = asyncio.run(setup_mcp_proxy())
+    parse_cli_args(proxy_app.description)
     
-    if proxy_app:
-        print("\n" + "=" * 60)
-        print("启动 MCP 代理服务器...")
-        print("=" * 60)
-        print(f"\n按 Ctrl+C 停止服务器\n")
-        
-        import uvicorn
-        uvicorn.run(proxy_app, host="0.0.0.0", port=MCP_SERVER_PORT)
-    else:
-        print("\n❌ 无法启动 MCP 代理服务器")
+    print("\n" + "=" * 60)
+    print("启动 MCP 代理服务器...")
+    print("=" * 60)
+    print(f"\n工作进程: {MCP_SERVER_WORKERS}，事件循环: {UVICORN_LOOP}，HTTP 解析器: {UVICORN_HTTP}")
+    print(f"按 Ctrl+C 停止服务器\n")
+    
+    import uvicorn
+    # 以导入字符串启动，所有异步设置都运行在 uvicorn 的事件循环中
+    uvicorn.run(
+        "mcp_proxy_server:proxy_app",
+        host="0.0.0.0",
+        port=MCP_SERVER_PORT,
+        workers=MCP_SERVER_WORKERS,
+        loop=UVICORN_LOOP,
+        http=UVICORN_HTTP,
+    )
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,281 @@
+"""
+run_mcp_server.py 和 mcp_proxy_server.py 共用的部分
+
+包括：OpenAPI schema 的获取与本地缓存、连接 FastAPI 服务的共享 HTTP 客户端、
+MCP 应用的 lifespan、命令行参数以及 uvicorn 运行参数。各脚本只保留自己的配置和输出。
+"""
+
+import argparse
+import httpx
+import json
+import importlib.util
+import logging
+import os
+import time
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# 安装 orjson 后用它解析 OpenAPI schema（大文档解析快数倍），否则退回标准库 json
+_json_loads: Callable[[bytes], Any]
+if importlib.util.find_spec("orjson") is not None:
+    import orjson  # type: ignore[import-not-found]
+
+    _json_loads = orjson.loads
+else:
+    _json_loads = json.loads
+
+# ============================================
+# 配置
+# ============================================
+# 安装 uvloop / httptools 后（pip install "uvicorn[standard]"）使用 libuv 事件循环和 C 实现的 HTTP 解析器
+UVICORN_LOOP = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+UVICORN_HTTP = "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+# 安装 h2 后（pip install "httpx[http2]"）对 FastAPI 服务启用 HTTP/2 多路复用
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+# 安装 httpx-aiohttp 后可以选用 aiohttp 传输层（见 create_http_client 的 transport 参数）
+AIOHTTP_AVAILABLE = importlib.util.find_spec("httpx_aiohttp") is not None
+
+# 对应 MCP 工具的 HTTP 方法（OpenAPI path item 中的小写键）
+HTTP_METHODS = frozenset({"get", "post", "put", "delete", "patch"})
+
+# OpenAPI schema 本地缓存目录，启动时通过 ETag / Last-Modified 发送条件请求，未变化时无需重新下载
+SCHEMA_CACHE_DIR = Path.home() / ".cache" / "fastapi_mcp"
+
+# 本地缓存在这么多秒内视为最新，直接使用而不请求服务（开发时频繁重启很有用）；0 表示每次都发条件请求。
+# 通过环境变量 SCHEMA_MAX_AGE 设置
+DEFAULT_SCHEMA_MAX_AGE = 60.0
+
+# 设为 1 时忽略本地缓存，不带条件头完整下载 schema（命令行参数 --refresh-schema 会设置它）
+SCHEMA_REFRESH_ENV = "SCHEMA_REFRESH"
+
+# 进程内已解析的 schema，重复设置 MCP 服务器时不再重新解析
+_schema_memo: Dict[str, Dict[str, Any]] = {}
+
+# ============================================
+# OpenAPI schema
+# ============================================
+
+
+def schema_max_age() -> float:
+    """
+    读取环境变量 SCHEMA_MAX_AGE
+
+    本函数和 schema_refresh_requested() 都在每次调用时读取环境变量而不是在导入时读取：uvicorn 按导入字符串
+    重新导入脚本模块时，本模块已经导入过了，main() 中由 --refresh-schema 设置的环境变量要在 lifespan 中才能生效。
+    值不是数字（例如 "1m"）时记录警告并使用 DEFAULT_SCHEMA_MAX_AGE。
+    """
+    value = os.environ.get("SCHEMA_MAX_AGE")
+    if value is None:
+        return DEFAULT_SCHEMA_MAX_AGE
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"SCHEMA_MAX_AGE 应为秒数，忽略无效值 {value!r}，使用默认值 {DEFAULT_SCHEMA_MAX_AGE}")
+        return DEFAULT_SCHEMA_MAX_AGE
+
+
+def schema_refresh_requested() -> bool:
+    """是否通过环境变量 SCHEMA_REFRESH 要求强制重新下载 schema"""
+    return os.environ.get(SCHEMA_REFRESH_ENV) == "1"
+
+
+def _schema_cache_paths(api_url: str) -> Tuple[Path, Path]:
+    """返回某个服务对应的 schema 缓存文件和校验信息（ETag / Last-Modified）文件"""
+    host = urlsplit(api_url).netloc.replace(":", "_")
+    return SCHEMA_CACHE_DIR / f"openapi-{host}.json", SCHEMA_CACHE_DIR / f"openapi-{host}.meta.json"
+
+
+def _load_schema_validators(meta_path: Path) -> Dict[str, str]:
+    """读取上次保存的 ETag / Last-Modified，缓存不存在或损坏时返回空字典"""
+    try:
+        return _json_loads(meta_path.read_bytes())
+    except (OSError, ValueError):
+        return {}
+
+
+def _read_cached_schema(schema_path: Path) -> Optional[Dict[str, Any]]:
+    """读取本地缓存的 schema，文件不存在、不可读或不是有效的 JSON 时返回 None"""
+    try:
+        return _json_loads(schema_path.read_bytes())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """先写入同目录下的临时文件再 os.replace，写到一半被中断也不会留下截断的缓存文件"""
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        with suppress(OSError):
+            tmp_path.unlink()
+        raise
+
+
+def _save_schema_cache(api_url: str, response: httpx.Response) -> None:
+    """把 schema 原始字节和校验信息写入本地缓存，写入失败不影响启动"""
+    schema_path, meta_path = _schema_cache_paths(api_url)
+    validators = {}
+    if "etag" in response.headers:
+        validators["etag"] = response.headers["etag"]
+    if "last-modified" in response.headers:
+        validators["last_modified"] = response.headers["last-modified"]
+    try:
+        SCHEMA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # 先写 schema 再写校验信息：两次写入之间中断时，旧的 ETag 与新 schema 不匹配，下次只会多一次完整下载，
+        # 而不会出现新 ETag 配旧 schema 被 304 当成最新的情况
+        _write_atomic(schema_path, response.content)
+        _write_atomic(meta_path, json.dumps(validators).encode())
+    except OSError as e:
+        logger.warning(f"无法写入 OpenAPI schema 缓存 {schema_path}: {e}")
+
+
+async def fetch_openapi_schema(
+    api_url: str, max_age: Optional[float] = None, refresh: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    从 FastAPI 服务获取 OpenAPI schema（本地缓存 + 条件请求）
+
+    max_age 为本地缓存视为最新的秒数，默认读取环境变量 SCHEMA_MAX_AGE；refresh 为 True 时忽略本地缓存，
+    不带条件头完整下载，默认读取环境变量 SCHEMA_REFRESH。失败时抛出 RuntimeError。
+    """
+    if max_age is None:
+        max_age = schema_max_age()
+    if refresh is None:
+        refresh = schema_refresh_requested()
+    schema_path, meta_path = _schema_cache_paths(api_url)
+    if max_age > 0 and not refresh:
+        try:
+            is_fresh = time.time() - schema_path.stat().st_mtime < max_age
+        except OSError:
+            is_fresh = False
+        if is_fresh:
+            # 缓存足够新：不请求服务，优先复用进程内已解析的结果；缓存损坏时按正常流程请求服务
+            schema = _schema_memo.get(api_url) or _read_cached_schema(schema_path)
+            if schema is not None:
+                _schema_memo[api_url] = schema
+                return schema
+
+    validators = _load_schema_validators(meta_path) if schema_path.exists() and not refresh else {}
+    headers = {}
+    if "etag" in validators:
+        headers["If-None-Match"] = validators["etag"]
+    if "last_modified" in validators:
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        try:
+            schema = None
+            response = await client.get(f"{api_url}/openapi.json", headers=headers)
+            if response.status_code == 304:
+                # schema 未变化：优先复用进程内已解析的结果，否则读取本地缓存，并刷新缓存的新鲜期
+                schema = _schema_memo.get(api_url) or _read_cached_schema(schema_path)
+                if schema is not None:
+                    with suppress(OSError):
+                        schema_path.touch()
+                else:
+                    # 校验信息还在但缓存的 schema 读不出来：不带条件头重新完整下载，顺便修复缓存
+                    response = await client.get(f"{api_url}/openapi.json")
+            if schema is None:
+                response.raise_for_status()
+                schema = _json_loads(response.content)
+                _save_schema_cache(api_url, response)
+        except httpx.RequestError as e:
+            raise RuntimeError(f"无法连接到 FastAPI 服务 {api_url}: {e}") from e
+        except httpx.HTTPStatusError as e:
+            raise RuntimeError(f"获取 OpenAPI schema 失败: {e.response.status_code}") from e
+        except ValueError as e:
+            # 响应不是有效的 JSON（orjson.JSONDecodeError 也是 ValueError 的子类）
+            raise RuntimeError(f"无法解析 OpenAPI schema: {e}") from e
+
+    _schema_memo[api_url] = schema
+    return schema
+
+
+def ensure_operation_ids(openapi_schema: Dict[str, Any]) -> int:
+    """为缺少 operationId 的操作生成一个（MCP 工具以 operationId 命名），返回操作数量"""
+    operation_count = 0
+    for path, path_item in openapi_schema.get("paths", {}).items():
+        for method, operation in path_item.items():
+            if method not in HTTP_METHODS:
+                continue
+            if not operation.get("operationId"):
+                # 如果没有 operation_id，生成一个
+                operation["operationId"] = (
+                    f"{method}_{path.replace('/', '_').replace('{', '').replace('}', '').strip('_')}"
+                )
+            operation_count += 1
+    return operation_count
+
+
+# ============================================
+# HTTP 客户端与应用生命周期
+# ============================================
+
+
+def create_http_client(base_url: str, transport: str = "httpx") -> httpx.AsyncClient:
+    """
+    创建连接 FastAPI 服务的共享 HTTP 客户端（keepalive 连接池）
+
+    transport 为 "httpx" 时使用 httpx 默认传输层，并在安装了 h2 时启用 HTTP/2 多路复用；
+    为 "aiohttp" 时由 aiohttp 承担上游连接（高并发时吞吐更高，仅 HTTP/1.1），对外仍是同一个 httpx 客户端。
+    """
+    limits = httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=30.0)
+    if transport == "aiohttp":
+        if AIOHTTP_AVAILABLE:
+            from httpx_aiohttp import AiohttpTransport  # type: ignore[import-not-found]
+
+            # aiohttp 的 ClientSession 在第一次请求时于服务的事件循环中创建，连接上限与 keepalive 沿用 limits
+            return httpx.AsyncClient(
+                base_url=base_url,
+                timeout=30.0,
+                transport=AiohttpTransport(limits=limits),
+            )
+        logger.warning("未安装 httpx-aiohttp（pip install httpx-aiohttp），改用 httpx 传输层")
+    elif transport != "httpx":
+        raise ValueError(f"不支持的 HTTP 传输层: {transport}（可选 httpx / aiohttp）")
+    return httpx.AsyncClient(
+        base_url=base_url,
+        timeout=30.0,
+        http2=HTTP2_ENABLED,
+        limits=limits,
+    )
+
+
+def create_lifespan(setup: Callable[[FastAPI], Awaitable[bool]], error_message: str):
+    """
+    创建 MCP 应用的 lifespan：启动时在服务的事件循环中运行 setup(app)，返回 False 时以 error_message 中止启动；
+    关闭时释放 setup 保存在 app.state.client 中的 HTTP 客户端
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        try:
+            if not await setup(app):
+                raise RuntimeError(error_message)
+            yield
+        finally:
+            client = getattr(app.state, "client", None)
+            if client is not None:
+                await client.aclose()
+
+    return lifespan
+
+
+def parse_cli_args(description: str) -> argparse.Namespace:
+    """解析两个脚本共用的命令行参数"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--refresh-schema", action="store_true", help="忽略本地缓存，强制重新下载 OpenAPI schema")
+    args = parser.parse_args()
+    if args.refresh_schema:
+        # uvicorn 会按导入字符串重新导入脚本模块（多进程时在子进程中），通过环境变量传递
+        os.environ[SCHEMA_REFRESH_ENV] = "1"
+    return args
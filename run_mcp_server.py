@@ -8,13 +8,20 @@
 4. 在 Cursor 的 MCP 配置中添加：http://localhost:8000/mcp
 """
 
-import httpx
 import json
-import asyncio
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI
 from fastapi_mcp import FastApiMCP
-from typing import Dict, Any
+from starlette.middleware.gzip import GZipMiddleware
+
+from mcp_server_common import (
+    UVICORN_HTTP,
+    UVICORN_LOOP,
+    create_http_client,
+    create_lifespan,
+    ensure_operation_ids,
+    fetch_openapi_schema,
+    parse_cli_args,
+)
 
 # ============================================
 # 配置
@@ -27,120 +34,16 @@ MCP_SERVER_HOST = "0.0.0.0"
 MCP_SERVER_PORT = 8000
 MCP_MOUNT_PATH = "/mcp"
 
-# ============================================
-# 辅助函数
-# ============================================
+# uvicorn 工作进程数。MCP 的 HTTP 会话保存在进程内存中，多个工作进程之间不共享会话，
+# 只有在客户端不依赖会话或前面有会话粘滞的负载均衡时才调大（例如 os.cpu_count()）
+MCP_SERVER_WORKERS = 1
 
-async def fetch_openapi_schema(api_url: str) -> Dict[str, Any]:
-    """从 FastAPI 服务获取 OpenAPI schema"""
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        try:
-            response = await client.get(f"{api_url}/openapi.json")
-            response.raise_for_status()
-            return response.json()
-        except httpx.RequestError as e:
-            raise Exception(f"无法连接到 FastAPI 服务 {api_url}: {e}")
-        except httpx.HTTPStatusError as e:
-            raise Exception(f"获取 OpenAPI schema 失败: {e.response.status_code}")
+# 连接 FastAPI 服务的 HTTP 传输层："httpx"（安装 h2 后启用 HTTP/2 多路复用）或
+# "aiohttp"（需要 pip install httpx-aiohttp，高并发时吞吐更高，但只支持 HTTP/1.1）
+MCP_HTTP_TRANSPORT = "httpx"
 
-def create_proxy_routes(app: FastAPI, openapi_schema: Dict[str, Any], target_url: str):
-    """根据 OpenAPI schema 创建代理路由，将请求转发到目标 FastAPI 服务"""
-    paths = openapi_schema.get("paths", {})
-    
-    def create_proxy_handler(method: str, path_template: str):
-        """创建代理处理函数"""
-        async def handler(request: Request):
-            # 获取请求体
-            body = None
-            if request.method in ["POST", "PUT", "PATCH"]:
-                try:
-                    body = await request.json()
-                except:
-                    try:
-                        body = await request.body()
-                    except:
-                        pass
-            
-            # 获取查询参数
-            query_params = dict(request.query_params)
-            
-            # 获取请求头（转发授权等）
-            headers = {}
-            for header_name in ["authorization", "content-type"]:
-                if header_name in request.headers:
-                    headers[header_name] = request.headers[header_name]
-            
-            # 构建目标 URL，替换路径参数
-            target_path = path_template
-            path_params = request.path_params
-            for param_name, param_value in path_params.items():
-                target_path = target_path.replace(f"{{{param_name}}}", str(param_value))
-            
-            full_target_url = f"{target_url}{target_path}"
-            
-            # 发送请求到原始服务
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                try:
-                    response = await client.request(
-                        method=method,
-                        url=full_target_url,
-                        params=query_params,
-                        headers=headers,
-                        json=body if body and isinstance(body, dict) else None,
-                        content=body if body and not isinstance(body, dict) else None,
-                    )
-                    
-                    # 处理响应
-                    if response.headers.get("content-type", "").startswith("application/json"):
-                        try:
-                            content = response.json()
-                        except:
-                            content = {"content": response.text}
-                    else:
-                        content = {"content": response.text}
-                    
-                    return JSONResponse(
-                        content=content,
-                        status_code=response.status_code,
-                        headers=dict(response.headers),
-                    )
-                except httpx.RequestError as e:
-                    raise HTTPException(status_code=502, detail=f"无法连接到 FastAPI 服务: {e}")
-        
-        return handler
-    
-    # 为每个路径和方法创建路由
-    route_count = 0
-    for path, path_item in paths.items():
-        for method in ["get", "post", "put", "delete", "patch"]:
-            if method in path_item:
-                operation = path_item[method]
-                operation_id = operation.get("operationId")
-                if not operation_id:
-                    # 如果没有 operation_id，生成一个
-                    operation_id = f"{method}_{path.replace('/', '_').replace('{', '').replace('}', '').strip('_')}"
-                
-                # 创建处理函数
-                handler = create_proxy_handler(method.upper(), path)
-                
-                # 注册路由
-                if method == "get":
-                    app.get(path, operation_id=operation_id, include_in_schema=True)(handler)
-                elif method == "post":
-                    app.post(path, operation_id=operation_id, include_in_schema=True)(handler)
-                elif method == "put":
-                    app.put(path, operation_id=operation_id, include_in_schema=True)(handler)
-                elif method == "delete":
-                    app.delete(path, operation_id=operation_id, include_in_schema=True)(handler)
-                elif method == "patch":
-                    app.patch(path, operation_id=operation_id, include_in_schema=True)(handler)
-                
-                route_count += 1
-    
-    return route_count
-
-async def setup_mcp_server():
-    """设置 MCP 服务器"""
+async def setup_mcp_server(app: FastAPI) -> bool:
+    """在服务的事件循环中设置 MCP 服务器：获取 schema 并据此挂载 MCP 服务器，工具调用直接发往 FastAPI 服务"""
     print("=" * 70)
     print("MCP 服务器设置")
     print("=" * 70)
@@ -156,39 +59,33 @@ async def setup_mcp_server():
         print(f"  - 服务名称: {openapi_schema.get('info', {}).get('title', 'Unknown')}")
         print(f"  - 版本: {openapi_schema.get('info', {}).get('version', 'Unknown')}")
         print(f"  - 路径数量: {len(openapi_schema.get('paths', {}))}")
-    except Exception as e:
+    except RuntimeError as e:
         print(f"❌ 错误: {e}")
         print("\n请确保：")
         print(f"  1. FastAPI 服务运行在 {FASTAPI_SERVICE_URL}")
         print(f"  2. 服务可以访问 /openapi.json 端点")
-        return None
+        return False
     
-    # 创建代理 FastAPI 应用
-    print("\n正在创建 MCP 代理应用...")
-    proxy_app = FastAPI(
-        title=f"MCP Server for {openapi_schema.get('info', {}).get('title', 'API')}",
-        description=f"MCP 服务器，连接到 {FASTAPI_SERVICE_URL}",
-        version="1.0.0",
-    )
-    
-    # 创建代理路由
-    print("正在创建代理路由...")
-    route_count = create_proxy_routes(proxy_app, openapi_schema, FASTAPI_SERVICE_URL)
-    print(f"✓ 已创建 {route_count} 个代理路由")
+    # 配置 MCP 应用：不注册任何路由，工具直接由上游 schema 生成
+    print("\n正在配置 MCP 应用...")
+    app.title = f"MCP Server for {openapi_schema.get('info', {}).get('title', 'API')}"
+    operation_count = ensure_operation_ids(openapi_schema)
+    # 进程内只保留这一份 schema（与 fetch_openapi_schema 的缓存是同一个对象）：FastApiMCP 据此生成工具，
+    # /openapi.json 也直接返回它，不再重新生成
+    app.openapi = lambda: openapi_schema  # type: ignore[method-assign]
+    print(f"✓ 已从 schema 读取 {operation_count} 个接口")
+    # MCP 工具调用经由这个连接池直接发往 FastAPI 服务，由 lifespan 负责关闭
+    http_client = create_http_client(FASTAPI_SERVICE_URL, transport=MCP_HTTP_TRANSPORT)
+    app.state.client = http_client
     
     # 创建 MCP 服务器
     print("\n正在创建 MCP 服务器...")
     try:
-        # 使用自定义 HTTP 客户端连接到原始 FastAPI 服务
-        http_client = httpx.AsyncClient(
-            base_url=FASTAPI_SERVICE_URL,
-            timeout=30.0,
-        )
-        
         mcp = FastApiMCP(
-            proxy_app,
+            app,
             name=f"MCP Server for {openapi_schema.get('info', {}).get('title', 'API')}",
             http_client=http_client,
+            openapi_schema=openapi_schema,
         )
         
         mcp.mount_http(mount_path=MCP_MOUNT_PATH)
@@ -218,26 +115,47 @@ async def setup_mcp_server():
         print("5. 在 Cursor 中问 AI：'列出所有可用的工具' 来验证")
         print("\n" + "=" * 70)
         
-        return proxy_app
+        return True
         
     except Exception as e:
         print(f"❌ 创建 MCP 服务器失败: {e}")
         import traceback
         traceback.print_exc()
-        return None
+        return False
+
+# 启动时完成 MCP 服务器设置，关闭时释放 MCP 服务器使用的 HTTP 客户端
+lifespan = create_lifespan(setup_mcp_server, "无法启动 MCP 服务器")
+
+# 不含业务路由的 FastAPI 应用：schema 获取和 MCP 挂载都在 lifespan 中完成
+proxy_app = FastAPI(
+    title="MCP Server",
+    description=f"MCP 服务器，连接到 {FASTAPI_SERVICE_URL}",
+    version="1.0.0",
+    lifespan=lifespan,
+)
+# 压缩 1KB 以上的响应（大型 JSON 工具结果、/openapi.json）；已带 Content-Encoding 的响应
+# 和 text/event-stream 流不会被重复压缩
+proxy_app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 def main():
     """主函数"""
-    proxy_app = asyncio.run(setup_mcp_server())
+    parse_cli_args(proxy_app.description)
     
-    if proxy_app:
-        print(f"\n启动 MCP 服务器在端口 {MCP_SERVER_PORT}...")
-        print("按 Ctrl+C 停止服务器\n")
-        
-        import uvicorn
-        uvicorn.run(proxy_app, host=MCP_SERVER_HOST, port=MCP_SERVER_PORT, log_level="info")
-    else:
-        print("\n❌ 无法启动 MCP 服务器")
+    print(f"\n启动 MCP 服务器在端口 {MCP_SERVER_PORT}...")
+    print(f"工作进程: {MCP_SERVER_WORKERS}，事件循环: {UVICORN_LOOP}，HTTP 解析器: {UVICORN_HTTP}")
+    print("按 Ctrl+C 停止服务器\n")
+    
+    import uvicorn
+    # 以导入字符串启动，所有异步设置都运行在 uvicorn 的事件循环中
+    uvicorn.run(
+        "run_mcp_server:proxy_app",
+        host=MCP_SERVER_HOST,
+        port=MCP_SERVER_PORT,
+        workers=MCP_SERVER_WORKERS,
+        loop=UVICORN_LOOP,
+        http=UVICORN_HTTP,
+        log_level="info",
+    )
 
 if __name__ == "__main__":
     main()
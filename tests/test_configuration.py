@@ -1,4 +1,5 @@
 from fastapi import FastAPI
+from fastapi.openapi.utils import get_openapi
 import pytest
 
 from fastapi_mcp import FastApiMCP
@@ -581,3 +582,66 @@ def test_filtering_with_empty_tags_array():
     exclude_tags_mcp = FastApiMCP(app, exclude_tags=["items"])
     assert len(exclude_tags_mcp.tools) == 1
     assert {tool.name for tool in exclude_tags_mcp.tools} == {"empty_tags"}
+
+
+def test_explicit_openapi_schema():
+    """Test that an explicit openapi_schema is used as the source of the tools instead of the app's routes."""
+    app = FastAPI()
+
+    @app.get("/local/", operation_id="local_endpoint")
+    async def local_endpoint():
+        return {"result": "local"}
+
+    external_schema = {
+        "openapi": "3.1.0",
+        "info": {"title": "External API", "version": "1.0.0"},
+        "paths": {
+            "/items/{item_id}": {
+                "get": {
+                    "operationId": "get_external_item",
+                    "parameters": [
+                        {"name": "item_id", "in": "path", "required": True, "schema": {"type": "integer"}},
+                    ],
+                    "responses": {"200": {"description": "Successful Response"}},
+                }
+            }
+        },
+    }
+
+    mcp = FastApiMCP(app, openapi_schema=external_schema)
+
+    assert {tool.name for tool in mcp.tools} == {"get_external_item"}
+    assert "item_id" in mcp.tools[0].inputSchema["properties"]
+    assert mcp.operation_map["get_external_item"]["path"] == "/items/{item_id}"
+
+    # Refreshing keeps using the explicit schema
+    mcp.setup_server()
+    assert {tool.name for tool in mcp.tools} == {"get_external_item"}
+
+
+def test_refresh_with_custom_openapi():
+    """Test that setup_server() picks up new endpoints even when the app uses FastAPI's custom OpenAPI pattern."""
+    app = FastAPI()
+
+    @app.get("/a", operation_id="a")
+    async def a():
+        return {}
+
+    def custom_openapi():
+        if app.openapi_schema:
+            return app.openapi_schema
+        app.openapi_schema = get_openapi(title="Custom", version="1.0.0", routes=app.routes)
+        return app.openapi_schema
+
+    app.openapi = custom_openapi  # type: ignore[method-assign]
+    app.openapi()
+
+    mcp = FastApiMCP(app)
+    assert {tool.name for tool in mcp.tools} == {"a"}
+
+    @app.get("/b", operation_id="b")
+    async def b():
+        return {}
+
+    mcp.setup_server()
+    assert {tool.name for tool in mcp.tools} == {"a", "b"}
@@ -0,0 +1,269 @@
+import json
+import os
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import mcp_server_common
+from mcp_server_common import create_lifespan, ensure_operation_ids, fetch_openapi_schema
+
+API_URL = "http://upstream:6673"
+SCHEMA = {"openapi": "3.1.0", "info": {"title": "Upstream", "version": "1.0.0"}, "paths": {}}
+
+
+@pytest.fixture
+def schema_cache(tmp_path, monkeypatch):
+    """Point the schema cache at a temporary directory and start with an empty in-process memo."""
+    monkeypatch.setattr(mcp_server_common, "SCHEMA_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(mcp_server_common, "_schema_memo", {})
+    return tmp_path
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Route the schema fetch through an httpx.MockTransport and record every request it receives."""
+    state = {"requests": [], "etag": '"v1"', "schema": SCHEMA}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        state["requests"].append(request)
+        if request.headers.get("if-none-match") == state["etag"]:
+            return httpx.Response(304, headers={"etag": state["etag"]})
+        return httpx.Response(200, json=state["schema"], headers={"etag": state["etag"]})
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        mcp_server_common.httpx,
+        "AsyncClient",
+        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs),
+    )
+    return state
+
+
+def cache_files(cache_dir):
+    return cache_dir / "openapi-upstream_6673.json", cache_dir / "openapi-upstream_6673.meta.json"
+
+
+@pytest.mark.asyncio
+async def test_fetch_saves_schema_and_validators(schema_cache, upstream):
+    """A 200 response is parsed, written to disk and its ETag is kept for the next conditional request."""
+    schema = await fetch_openapi_schema(API_URL, max_age=0)
+
+    assert schema == SCHEMA
+    schema_path, meta_path = cache_files(schema_cache)
+    assert json.loads(schema_path.read_bytes()) == SCHEMA
+    assert json.loads(meta_path.read_text()) == {"etag": '"v1"'}
+    assert "if-none-match" not in upstream["requests"][0].headers
+    assert not list(schema_cache.glob("*.tmp"))
+
+
+@pytest.mark.asyncio
+async def test_not_modified_reads_cached_schema(schema_cache, upstream, monkeypatch):
+    """A 304 answer to the conditional request is served from the cache on disk."""
+    await fetch_openapi_schema(API_URL, max_age=0)
+    monkeypatch.setattr(mcp_server_common, "_schema_memo", {})
+
+    schema = await fetch_openapi_schema(API_URL, max_age=0)
+
+    assert schema == SCHEMA
+    assert len(upstream["requests"]) == 2
+    assert upstream["requests"][1].headers["if-none-match"] == '"v1"'
+
+
+@pytest.mark.asyncio
+async def test_changed_schema_replaces_cache(schema_cache, upstream):
+    """A new ETag on the server means a full download that overwrites the cache."""
+    await fetch_openapi_schema(API_URL, max_age=0)
+    new_schema = {**SCHEMA, "paths": {"/items": {}}}
+    upstream.update(etag='"v2"', schema=new_schema)
+
+    schema = await fetch_openapi_schema(API_URL, max_age=0)
+
+    assert schema == new_schema
+    schema_path, meta_path = cache_files(schema_cache)
+    assert json.loads(schema_path.read_bytes()) == new_schema
+    assert json.loads(meta_path.read_text()) == {"etag": '"v2"'}
+
+
+@pytest.mark.asyncio
+async def test_fresh_cache_skips_network(schema_cache, upstream, monkeypatch):
+    """A cache younger than max_age is used without contacting the server."""
+    await fetch_openapi_schema(API_URL, max_age=0)
+    monkeypatch.setattr(mcp_server_common, "_schema_memo", {})
+
+    schema = await fetch_openapi_schema(API_URL, max_age=60)
+
+    assert schema == SCHEMA
+    assert len(upstream["requests"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_max_age_from_environment(schema_cache, upstream, monkeypatch):
+    """SCHEMA_MAX_AGE is read on every call, so a value set after import still applies."""
+    await fetch_openapi_schema(API_URL, max_age=0)
+
+    monkeypatch.setenv("SCHEMA_MAX_AGE", "0")
+    await fetch_openapi_schema(API_URL)
+    assert len(upstream["requests"]) == 2
+
+    monkeypatch.setenv("SCHEMA_MAX_AGE", "60")
+    await fetch_openapi_schema(API_URL)
+    assert len(upstream["requests"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_invalid_max_age_uses_default(schema_cache, upstream, monkeypatch, caplog):
+    """A SCHEMA_MAX_AGE that isn't a number of seconds is reported and the default freshness window applies."""
+    await fetch_openapi_schema(API_URL, max_age=0)
+
+    monkeypatch.setenv("SCHEMA_MAX_AGE", "1m")
+    with caplog.at_level("WARNING", logger="mcp_server_common"):
+        await fetch_openapi_schema(API_URL)
+
+    assert len(upstream["requests"]) == 1
+    assert "'1m'" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_corrupt_fresh_cache_falls_back_to_network(schema_cache, upstream):
+    """An unreadable cache inside the freshness window is treated as a miss and fetched again."""
+    schema_path, _ = cache_files(schema_cache)
+    schema_path.write_text("{truncated")
+
+    schema = await fetch_openapi_schema(API_URL, max_age=60)
+
+    assert schema == SCHEMA
+    assert len(upstream["requests"]) == 1
+    assert json.loads(schema_path.read_bytes()) == SCHEMA
+
+
+@pytest.mark.asyncio
+async def test_not_modified_with_corrupt_cache_refetches(schema_cache, upstream, monkeypatch):
+    """A 304 whose cached body can't be read falls back to a full download and repairs the cache."""
+    await fetch_openapi_schema(API_URL, max_age=0)
+    monkeypatch.setattr(mcp_server_common, "_schema_memo", {})
+    schema_path, _ = cache_files(schema_cache)
+    schema_path.write_text("{truncated")
+
+    schema = await fetch_openapi_schema(API_URL, max_age=0)
+
+    assert schema == SCHEMA
+    assert [request.headers.get("if-none-match") for request in upstream["requests"]] == [None, '"v1"', None]
+    assert json.loads(schema_path.read_bytes()) == SCHEMA
+
+
+@pytest.mark.asyncio
+async def test_refresh_skips_cache_and_validators(schema_cache, upstream, monkeypatch):
+    """refresh=True (or SCHEMA_REFRESH=1) ignores a fresh cache and downloads without conditional headers."""
+    await fetch_openapi_schema(API_URL, max_age=0)
+
+    await fetch_openapi_schema(API_URL, max_age=60, refresh=True)
+    monkeypatch.setenv("SCHEMA_REFRESH", "1")
+    await fetch_openapi_schema(API_URL, max_age=60)
+
+    assert len(upstream["requests"]) == 3
+    assert all("if-none-match" not in request.headers for request in upstream["requests"])
+
+
+@pytest.mark.asyncio
+async def test_failed_cache_write_keeps_previous_cache(schema_cache, upstream, monkeypatch):
+    """An interrupted write leaves the previous cache file intact and no temp file behind."""
+    await fetch_openapi_schema(API_URL, max_age=0)
+    upstream.update(etag='"v2"', schema={**SCHEMA, "paths": {"/items": {}}})
+
+    def failing_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(mcp_server_common.os, "replace", failing_replace)
+    schema = await fetch_openapi_schema(API_URL, max_age=0)
+
+    assert schema["paths"] == {"/items": {}}
+    schema_path, meta_path = cache_files(schema_cache)
+    assert json.loads(schema_path.read_bytes()) == SCHEMA
+    assert json.loads(meta_path.read_text()) == {"etag": '"v1"'}
+    assert not list(schema_cache.glob("*.tmp"))
+
+
+@pytest.mark.asyncio
+async def test_unreachable_server_raises_runtime_error(schema_cache, monkeypatch):
+    """Connection errors surface as RuntimeError, which the scripts report before aborting startup."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        raise httpx.ConnectError("connection refused", request=request)
+
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(
+        mcp_server_common.httpx,
+        "AsyncClient",
+        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs),
+    )
+
+    with pytest.raises(RuntimeError, match="无法连接到 FastAPI 服务"):
+        await fetch_openapi_schema(API_URL, max_age=0)
+    assert not os.listdir(schema_cache)
+
+
+def test_ensure_operation_ids_fills_missing_ids():
+    """Operations without an operationId get one derived from method and path; existing ids are kept."""
+    schema = {
+        "paths": {
+            "/items/{item_id}": {
+                "summary": "Item",
+                "parameters": [{"name": "item_id", "in": "path"}],
+                "get": {},
+                "delete": {"operationId": "remove_item"},
+            },
+            "/items": {"post": {"operationId": ""}},
+        }
+    }
+
+    assert ensure_operation_ids(schema) == 3
+    item = schema["paths"]["/items/{item_id}"]
+    assert item["get"]["operationId"] == "get_items_item_id"
+    assert item["delete"]["operationId"] == "remove_item"
+    assert item["summary"] == "Item"
+    assert item["parameters"] == [{"name": "item_id", "in": "path"}]
+    assert schema["paths"]["/items"]["post"]["operationId"] == "post_items"
+
+
+class RecordingClient:
+    """Stand-in for the shared httpx client that only records whether it was closed."""
+
+    def __init__(self):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_lifespan_failed_setup_raises_and_closes_client():
+    """A setup that returns False aborts startup with the given message and still closes its client."""
+    client = RecordingClient()
+
+    async def setup(app: FastAPI) -> bool:
+        app.state.client = client
+        return False
+
+    app = FastAPI(lifespan=create_lifespan(setup, "setup failed"))
+
+    with pytest.raises(RuntimeError, match="setup failed"):
+        async with app.router.lifespan_context(app):
+            pass
+    assert client.closed
+
+
+@pytest.mark.asyncio
+async def test_lifespan_closes_client_on_shutdown():
+    """After a successful setup the client stays open while the app runs and is closed on shutdown."""
+    client = RecordingClient()
+
+    async def setup(app: FastAPI) -> bool:
+        app.state.client = client
+        return True
+
+    app = FastAPI(lifespan=create_lifespan(setup, "setup failed"))
+
+    async with app.router.lifespan_context(app):
+        assert not client.closed
+    assert client.closed